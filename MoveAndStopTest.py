@@ -6,17 +6,28 @@ Download Python ZED SDK by following this tutorial: https://www.stereolabs.com/d
 Author: Harrison Bui
 Date: February 14, 2024
     Updated: March 12, 2024 (incorporated multiprocessing for using Motor Controls)
+    Updated: October 15, 2026 (switched Motor Controls from a separate process to a thread)
 """
 
 from MotorControlAPI import MotorController
 import pyzed.sl as sl
-import math
-import multiprocessing
+import numpy as np
 import sys
+import threading
 import time
 import os
 import queue
 
+try:
+    import cupy as cp  # optional; lets depth data be scanned directly in GPU memory
+except ImportError:
+    cp = None
+
+try:
+    from numba import njit  # optional; compiles the depth row scan to machine code
+except ImportError:
+    njit = None
+
 # how close robot should be allowed to approach obstacle (in cm); for captureImages...() functions
 MIN_THRESHOLD_DISTANCE_CM = 300
 MAX_THRESHOLD_DISTANCE_CM = 325
@@ -32,6 +43,27 @@ TURNING_SPEED = 10
 # how often to send the same move/turn command to robot (in ms between commands) to make it do the same thing overtime
 COMMAND_SEND_PERIOD_MS = 100
 
+# resolution (in pixels) to retrieve depth measurements at; the ZED SDK downsamples on the GPU before copying, so less
+# data is moved per frame (obstacle coordinates are reported in this resolution)
+DEPTH_WIDTH = 320
+DEPTH_HEIGHT = 180
+DEPTH_RESOLUTION = sl.Resolution(DEPTH_WIDTH, DEPTH_HEIGHT)
+DEPTH_CENTER_X = int(DEPTH_WIDTH / 2)
+DEPTH_CENTER_Y = int(DEPTH_HEIGHT / 2)
+
+# band of horizontal lines around center of depth image to scan for obstacles (in pixels of DEPTH_RESOLUTION)
+SCAN_BAND_HALF_HEIGHT = 15
+SCAN_ROW_STEP = 2
+
+# half the size of window around center of depth image used to check if way ahead is clear (in pixels)
+CENTER_WINDOW_HALF_SIZE = 4
+
+# runtime parameters shared by every capture; depth values with confidence below the threshold are discarded, and
+# measurements stay relative to the camera since obstacle detection never needs world-frame positions
+RUNTIME_PARAMETERS = sl.RuntimeParameters()
+RUNTIME_PARAMETERS.confidence_threshold = 50
+RUNTIME_PARAMETERS.measure3D_reference_frame = sl.REFERENCE_FRAME.CAMERA
+
 # miscellaneous
 PROGRAM_START_TIME_MS = None  # reference start time of tests (in ms) after initialization
 MS_PER_SEC = 1000  # number of milliseconds per second
@@ -41,153 +73,385 @@ MS_PER_SEC = 1000  # number of milliseconds per second
 # ======================================================================================================================
 
 
-def clipData(data_to_fix, lower_bound, upper_bound):
+def makeClipper(lower_bound, upper_bound):
     """
-    Determines new value for given value so that it stays within given bounds. Values outside of bounds get reassigned
-    to the closest bound value. Function is used to clean up noise in depth sensor data.
+    Makes a function that determines new value for given value so that it stays within given bounds. Values outside of
+    bounds (or NaN) get reassigned to the closest bound value. Function is used to clean up noise in depth sensor data.
+    The bounds are bound in, so they don't need to be looked up as globals and passed in on every call.
 
-    :param data_to_fix: float value to recompute from
     :param lower_bound: the lowest value acceptable for value
     :param upper_bound: the highest value acceptable for value
 
-    :return: the updated data value as a float
+    :return: function taking the float value to recompute from and returning the updated data value as a float
+    """
+    def clip(data_to_fix):
+        if data_to_fix > upper_bound or data_to_fix != data_to_fix:  # NaN is the only value not equal to itself
+            return upper_bound
+        elif data_to_fix < lower_bound:
+            return lower_bound
+        return data_to_fix
+
+    return clip
+
+
+# cleans up a depth value (in cm) using the obstacle depth bounds
+clipDepth = makeClipper(MIN_OBSTACLE_DEPTH_CM, MAX_OBSTACLE_DEPTH_CM)
+
+
+def getRowsToScan(center_y):
     """
-    if data_to_fix > upper_bound or math.isnan(data_to_fix):
-        return upper_bound
-    elif data_to_fix < lower_bound:
-        return lower_bound
-    return data_to_fix
+    Determines which horizontal lines of the depth image to scan for obstacles: every SCAN_ROW_STEP-th line within
+    SCAN_BAND_HALF_HEIGHT lines of the center line. Scanning a band instead of a single line keeps obstacles that sit
+    slightly above or below the center line from being missed.
 
+    :param center_y: index of center line of depth measurement
 
-def getCoordinatesOfCloseObstacle(image, depth_matrix):
+    :return: the lines to scan as a slice of row indices
     """
-    Detects approximate point on center line of image for any obstacle that may be close. Limited to only detecting a
-    single obstacle.
+    return slice(max(center_y - SCAN_BAND_HALF_HEIGHT, 0), center_y + SCAN_BAND_HALF_HEIGHT + 1, SCAN_ROW_STEP)
+
 
-    :param image: image retrieved using ZED SDK
-    :param depth_matrix: depth measurement retrieved using ZED SDK (in cm)
+# lines of depth images to scan for obstacles
+DEPTH_ROWS_TO_SCAN = getRowsToScan(DEPTH_CENTER_Y)
 
-    :return: center of obstacle (x, y) as a 2-tuple, or None if no obstacle detected
+
+def isObstacleInColumn(band, column, upper_bound):
     """
-    # initialization
-    centerY = int(image.get_height() / 2)
-    depthList = []  # stores depth values of pixels on center horizontal line of image
+    Checks whether any depth value in a column of a band of depth values is close enough to be part of an obstacle.
+    NaN values never compare as less than the bound, so missing depth data counts as no obstacle.
 
-    # extracts depth values on center horizontal line of image
-    for currentX in range(image.get_width()):
-        error, currentDepth = depth_matrix.get_value(currentX, centerY)
-        # cleans up data
-        currentDepth = clipData(currentDepth, MIN_OBSTACLE_DEPTH_CM, MAX_OBSTACLE_DEPTH_CM)
-        depthList.append(currentDepth)
+    :param band: 2D float32 array of depth values (in cm)
+    :param column: index of column to check
+    :param upper_bound: depth values at or above this are not considered part of an obstacle
+
+    :return: True if column has part of an obstacle, otherwise False
+    """
+    for currentY in range(band.shape[0]):
+        if band[currentY, column] < upper_bound:
+            return True
+    return False
 
+
+def getDepthStraightAhead(depth_array, center_x, center_y):
+    """
+    Gets depth value straight ahead of camera: the closest depth value in a small window around the center of the
+    image. Much cheaper than scanning for obstacles when only whether the way ahead is clear matters.
+
+    :param depth_array: depth measurement retrieved using ZED SDK as a NumPy (or CuPy) array (in cm)
+    :param center_x: index of center column of depth measurement
+    :param center_y: index of center line of depth measurement
+
+    :return: the depth value (in cm) as a float
+    """
+    window = depth_array[center_y - CENTER_WINDOW_HALF_SIZE:center_y + CENTER_WINDOW_HALF_SIZE,
+                         center_x - CENTER_WINDOW_HALF_SIZE:center_x + CENTER_WINDOW_HALF_SIZE]
+    if cp is not None:
+        window = cp.asnumpy(window)  # only copies the window off the GPU
+    return clipDepth(float(np.fmin.reduce(window, axis=None)))
+
+
+def findObstacleBoundsInBand(band, upper_bound):
+    """
+    Finds where the first obstacle starts and ends on a band of horizontal lines of depth values. When compiled with
+    Numba, combining the lines and searching for the obstacle are done in a single pass that compares the depth values
+    in place against the bound and stops as soon as the obstacle ends. Depth values are neither clipped nor have NaN
+    replaced (NaN never compares as less than the bound, so it counts as no obstacle); only the single depth value
+    reported for the obstacle is clipped afterwards by clipDepth().
+
+    :param band: 2D float32 array of depth values (in cm), e.g. a strided view of the depth image; not modified
+    :param upper_bound: depth values at or above this are not considered part of an obstacle
+
+    :return: leftmost pixel of obstacle and first pixel past it as a 2-tuple, or (-1, -1) if no obstacle detected
+    """
     # finds leftmost pixel of obstacle
     leftBoundX = 0
-    while leftBoundX < len(depthList) and depthList[leftBoundX] >= MAX_OBSTACLE_DEPTH_CM:
+    while leftBoundX < band.shape[1] and not isObstacleInColumn(band, leftBoundX, upper_bound):
         leftBoundX += 1
 
     # checks if no obstacle detected
-    if leftBoundX >= len(depthList):
-        return None
+    if leftBoundX >= band.shape[1]:
+        return -1, -1
 
     # finds rightmost pixel of obstacle
     rightBoundX = leftBoundX + 1
-    while rightBoundX < len(depthList) and depthList[rightBoundX] < MAX_OBSTACLE_DEPTH_CM:
+    while rightBoundX < band.shape[1] and isObstacleInColumn(band, rightBoundX, upper_bound):
         rightBoundX += 1
 
+    return leftBoundX, rightBoundX
+
+
+if njit is not None:
+    isObstacleInColumn = njit(cache=True)(isObstacleInColumn)
+    findObstacleBoundsInBand = njit(cache=True)(findObstacleBoundsInBand)
+
+
+def getCoordinatesOfCloseObstacle(depth_array, width, center_y, rows_to_scan):
+    """
+    Detects approximate point on center line of image for any obstacle that may be close. Limited to only detecting a
+    single obstacle. Lines within a band around the center line are scanned, using the closest depth value in each
+    column.
+
+    :param depth_array: depth measurement retrieved using ZED SDK as a NumPy array (in cm)
+    :param width: width of depth measurement (in pixels)
+    :param center_y: index of center line of depth measurement
+    :param rows_to_scan: lines of depth measurement to scan, as returned by getRowsToScan()
+
+    :return: center of obstacle and closest depth value in its column (x, y, depth) as a 3-tuple, or None if no
+        obstacle detected
+    """
+    if njit is not None:
+        # finds obstacle in a single compiled pass over horizontal lines around center of image
+        band = depth_array[rows_to_scan, :width]  # view, so no depth values are copied
+        leftBoundX, rightBoundX = findObstacleBoundsInBand(band, MAX_OBSTACLE_DEPTH_CM)
+        if leftBoundX < 0:
+            return None
+    else:
+        # keeps closest depth value in each column by reducing the horizontal lines around center of image straight from
+        # the depth image (fmin skips NaN, so the lines are neither copied nor cleaned up first)
+        row = np.fmin.reduce(depth_array[rows_to_scan, :width], axis=0)
+
+        # checks if no obstacle detected; no need to clean up data first since NaN (no depth data in whole column)
+        # never compares as less than the bound, so it counts as no obstacle
+        isObstacle = row < MAX_OBSTACLE_DEPTH_CM
+        if not isObstacle.any():
+            return None
+
+        # finds leftmost pixel of obstacle (argmax stops at first True)
+        leftBoundX = int(isObstacle.argmax())
+
+        # finds rightmost pixel of obstacle (first pixel past the left bound that is no longer part of the obstacle)
+        isClearAfterObstacle = ~isObstacle[leftBoundX + 1:]
+        if isClearAfterObstacle.any():
+            rightBoundX = leftBoundX + 1 + int(isClearAfterObstacle.argmax())
+        else:
+            rightBoundX = len(row)
+
     # gets center pixel between the two boundary pixels
     centerOfObstacleX = int((leftBoundX + rightBoundX) / 2)
-    return centerOfObstacleX, centerY
 
+    # gets closest depth value in center column of obstacle, reusing the reduced row when there is one
+    if njit is not None:
+        depthValue = float(np.fmin.reduce(band[:, centerOfObstacleX]))
+    else:
+        depthValue = float(row[centerOfObstacleX])
+    depthValue = clipDepth(depthValue)
+    return centerOfObstacleX, center_y, depthValue
+
+
+def wrapDepthMatrixOnGPU(depth_matrix):
+    """
+    Views a depth matrix kept in GPU memory as a CuPy array without copying it.
+
+    :param depth_matrix: depth measurement retrieved using ZED SDK into sl.MEM.GPU (in cm)
+
+    :return: the depth measurement as a CuPy array; only valid until the Mat is overwritten
+    """
+    # rows of the Mat may be padded, so strides come from its step size
+    width = depth_matrix.get_width()
+    height = depth_matrix.get_height()
+    stepBytes = depth_matrix.get_step_bytes(sl.MEM.GPU)
+    memory = cp.cuda.UnownedMemory(depth_matrix.get_pointer(sl.MEM.GPU), height * stepBytes, depth_matrix)
+    return cp.ndarray((height, width), dtype=cp.float32, memptr=cp.cuda.MemoryPointer(memory, 0),
+                      strides=(stepBytes, cp.dtype(cp.float32).itemsize))
+
+
+if cp is not None:
+    # for each column of a band of depth values, finds closest depth value (cleaned up like clipDepth()) and whether it
+    # is part of an obstacle, fused into a single GPU kernel; NaN never compares as less, so it is skipped
+    findClosestDepthInColumnsOnGPU = cp.ElementwiseKernel(
+        'raw T band, int32 rows, T lower_bound, T upper_bound',
+        'T closestDepth, bool isObstacle',
+        """
+        T closest = upper_bound;
+        for (int y = 0; y < rows; y++) {
+            ptrdiff_t index[] = {y, i};
+            if (band[index] < closest) {
+                closest = band[index];
+            }
+        }
+        closestDepth = closest > lower_bound ? closest : lower_bound;
+        isObstacle = closest < upper_bound;
+        """,
+        'find_closest_depth_in_columns')
+
+
+def getCoordinatesOfCloseObstacleOnGPU(depth_array):
+    """
+    Same as getCoordinatesOfCloseObstacle(), but scans a depth measurement kept in GPU memory using CuPy so that only
+    the result is copied back to the CPU instead of the whole depth image.
+
+    :param depth_array: depth measurement as a CuPy array (in cm) of DEPTH_RESOLUTION
+
+    :return: center of obstacle (x, y) and its depth value as a 3-tuple; center of image if no obstacle detected
+    """
+    # keeps closest depth value in each column of horizontal lines around center of image
+    band = depth_array[DEPTH_ROWS_TO_SCAN]
+    row = cp.empty(DEPTH_WIDTH, dtype=cp.float32)
+    isObstacle = cp.empty(DEPTH_WIDTH, dtype=cp.bool_)
+    findClosestDepthInColumnsOnGPU(band, band.shape[0], MIN_OBSTACLE_DEPTH_CM, MAX_OBSTACLE_DEPTH_CM, row, isObstacle)
+
+    # finds leftmost pixel of obstacle and first pixel past it that is no longer part of the obstacle
+    leftBoundX = cp.argmax(isObstacle)
+    isClearAfterObstacle = ~isObstacle & (cp.arange(DEPTH_WIDTH) > leftBoundX)
+    rightBoundX = cp.where(isClearAfterObstacle.any(), cp.argmax(isClearAfterObstacle), DEPTH_WIDTH)
+
+    # gets center pixel between the two boundary pixels (or center of image if no obstacle) and only copies it back
+    centerOfObstacleX = cp.where(isObstacle.any(), (leftBoundX + rightBoundX) // 2, DEPTH_CENTER_X)
+    centerOfObstacleX, depthValue = cp.stack((centerOfObstacleX.astype(cp.float32), row[centerOfObstacleX])).get()
+    return int(centerOfObstacleX), DEPTH_CENTER_Y, float(depthValue)
+
+
+class LatestDepthGrabber:
+    """
+    Grabs depth measurements from the ZED camera on a separate thread, keeping only the most recent one. Measurements
+    that are not used in time get replaced instead of queued up, so obstacle detection always works on the latest
+    frame rather than falling behind the camera. Depth measurements are kept as CuPy arrays in GPU memory when CuPy is
+    installed, otherwise as NumPy arrays.
 
-def captureImageAndCheckForObstacle(zed, left_image, left_depth_matrix, runtime_params):
+    Three depth buffers are allocated up front and reused (one being written to, one holding the latest measurement,
+    and one being used by the caller of getNewDepth()), so no memory is allocated per frame.
     """
-    Captures a single image and detects location and depth value of any close obstacle. Helper function for the
+
+    def __init__(self, zed):
+        """
+        :param zed: the opened ZED camera whose depth sensor to use
+        """
+        self.zed = zed
+        self.stopEvent = threading.Event()
+        self.newDepthCondition = threading.Condition()  # protects everything below and signals new measurements
+        arrayModule = cp if cp is not None else np
+        self.depthBuffers = [arrayModule.empty((DEPTH_HEIGHT, DEPTH_WIDTH), dtype=np.float32)
+                             for _ in range(3)]
+        self.latestBufferIndex = None  # buffer holding latest depth measurement
+        self.inUseBufferIndex = None  # buffer last returned by getNewDepth()
+        self.timestampMillisecond = None
+        self.frameNumber = 0  # number of depth measurements grabbed so far
+        self.lastFrameNumberUsed = 0
+        self.grabThread = threading.Thread(target=self.grabUntilStopped, daemon=True)
+
+    def start(self):
+        """
+        Starts grabbing depth measurements in the background.
+        """
+        self.grabThread.start()
+
+    def stop(self):
+        """
+        Stops grabbing depth measurements. Should be called before closing the camera.
+        """
+        self.stopEvent.set()
+        self.grabThread.join()
+
+    def grabUntilStopped(self):
+        """
+        Repeatedly grabs depth measurements, replacing the latest one each time. Executed on the grab thread.
+        """
+        depthMatrix = sl.Mat()
+        while not self.stopEvent.is_set():
+            error = self.zed.grab(RUNTIME_PARAMETERS)
+            if error != sl.ERROR_CODE.SUCCESS:
+                print("Failed to grab image. Error: {0}".format(error))
+                continue
+
+            # picks buffer that is neither holding the latest depth measurement nor being used
+            with self.newDepthCondition:
+                writeBufferIndex = next(index for index in range(len(self.depthBuffers))
+                                        if index != self.latestBufferIndex and index != self.inUseBufferIndex)
+
+            # copies left depth image since the Mat gets overwritten by the next grab
+            if cp is not None:
+                self.zed.retrieve_measure(depthMatrix, sl.MEASURE.DEPTH, sl.MEM.GPU, DEPTH_RESOLUTION)
+                cp.copyto(self.depthBuffers[writeBufferIndex], wrapDepthMatrixOnGPU(depthMatrix))
+            else:
+                self.zed.retrieve_measure(depthMatrix, sl.MEASURE.DEPTH, sl.MEM.CPU, DEPTH_RESOLUTION)
+                np.copyto(self.depthBuffers[writeBufferIndex], depthMatrix.get_data())
+            timestampMillisecond = self.zed.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_milliseconds()
+
+            with self.newDepthCondition:
+                self.latestBufferIndex = writeBufferIndex
+                self.timestampMillisecond = timestampMillisecond
+                self.frameNumber += 1
+                self.newDepthCondition.notify_all()
+
+    def getNewDepth(self):
+        """
+        Waits until a depth measurement newer than the last one returned is grabbed. The returned depth measurement
+        stays valid until the next call.
+
+        :return: latest depth measurement (in cm) and its timestamp (in ms) as a 2-tuple
+        """
+        with self.newDepthCondition:
+            self.newDepthCondition.wait_for(lambda: self.frameNumber > self.lastFrameNumberUsed)
+            self.lastFrameNumberUsed = self.frameNumber
+            self.inUseBufferIndex = self.latestBufferIndex
+            return self.depthBuffers[self.inUseBufferIndex], self.timestampMillisecond
+
+
+def captureImageAndCheckForObstacle(depth_grabber):
+    """
+    Gets the latest depth image and detects location and depth value of any close obstacle. Helper function for the
     captureImagesUntil* functions.
 
-    :param zed: the ZED camera whose depth sensor to use
-    :param left_image: the Mat object for storing image
-    :param left_depth_matrix: the Mat object for storing depth matrix
-    :param runtime_params: runtime parameters for ZED camera
+    :param depth_grabber: the LatestDepthGrabber to get depth images from
 
     :return: depth value, x, y
     """
-    # grabs an image
-    error = zed.grab(runtime_params)
-    x = int(left_image.get_width() / 2)
-    y = int(left_image.get_height() / 2)
-    depthValue = None
-    if error == sl.ERROR_CODE.SUCCESS:
-        zed.retrieve_image(left_image, sl.VIEW.LEFT)  # gets left image
-        zed.retrieve_measure(left_depth_matrix, sl.MEASURE.DEPTH)  # gets left depth image
-
-        # gets depth value of obstacle, if any
-        obstacleCoordinates = getCoordinatesOfCloseObstacle(left_image, left_depth_matrix)
-        if obstacleCoordinates is None:
-            x = int(left_image.get_width() / 2)
-            y = int(left_image.get_height() / 2)
-        else:
-            x, y = obstacleCoordinates
-        err, depthValue = left_depth_matrix.get_value(x, y)
-        depthValue = clipData(depthValue, MIN_OBSTACLE_DEPTH_CM, MAX_OBSTACLE_DEPTH_CM)
-        timestampMillisecond = zed.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_milliseconds()
-        print("Time: {0} ms, Distance from camera at ({1}, {2}): {3} cm".format(timestampMillisecond -
-            PROGRAM_START_TIME_MS, x, y, depthValue))
+    depthArray, timestampMillisecond = depth_grabber.getNewDepth()
+
+    # gets depth value of obstacle, if any
+    if cp is not None:
+        x, y, depthValue = getCoordinatesOfCloseObstacleOnGPU(depthArray)
     else:
-        print("Failed to grab image. Error: {0}".format(error))
+        # no obstacle means every column in the band is at or beyond the max depth (or has no depth data)
+        x, y, depthValue = DEPTH_CENTER_X, DEPTH_CENTER_Y, MAX_OBSTACLE_DEPTH_CM
+        obstacle = getCoordinatesOfCloseObstacle(depthArray, DEPTH_WIDTH, DEPTH_CENTER_Y, DEPTH_ROWS_TO_SCAN)
+        if obstacle is not None:
+            x, y, depthValue = obstacle
+    print("Time: {0} ms, Distance from camera at ({1}, {2}): {3} cm".format(timestampMillisecond -
+        PROGRAM_START_TIME_MS, x, y, depthValue))
 
     return depthValue, x, y
 
 
-def captureImagesUntilCloseToObstacle(zed):
+def captureImagesUntilCloseToObstacle(depth_grabber):
     """
     Uses depth sensor to wait until a close obstacle is detected. Used to avoid colliding into obstacles.
 
-    :param zed: the ZED camera whose depth sensor to use
+    :param depth_grabber: the LatestDepthGrabber to get depth images from
 
-    :return: data of frame in which close obstacle detected as a 3-tuple (x, y, image)
+    :return: coordinates of close obstacle detected as a 2-tuple (x, y)
     """
-    # initialization for using sensor data
-    leftImage = sl.Mat()
-    leftDepthMatrix = sl.Mat()
-    runtimeParameters = sl.RuntimeParameters()
-
     # keeps capturing depth images until obstacle detect
     depthValue = None
-    x = int(leftImage.get_width() / 2)
-    y = int(leftImage.get_height() / 2)
+    x, y = DEPTH_CENTER_X, DEPTH_CENTER_Y
     while depthValue is None or depthValue > MIN_THRESHOLD_DISTANCE_CM:
-        depthValue, x, y = captureImageAndCheckForObstacle(zed, leftImage, leftDepthMatrix, runtimeParameters)
+        depthValue, x, y = captureImageAndCheckForObstacle(depth_grabber)
 
-    return x, y, leftImage
+    return x, y
 
 
-def captureImagesUntilClear(zed):
+def captureImagesUntilClear(depth_grabber):
     """
     Uses depth sensor to wait until no close obstacle is detected. Used to find open area to move to.
 
-    :param zed: the ZED camera whose depth sensor to use
+    :param depth_grabber: the LatestDepthGrabber to get depth images from
     """
-    # initialization for using sensor data
-    leftImage = sl.Mat()
-    leftDepthMatrix = sl.Mat()
-    runtime_params = sl.RuntimeParameters()
-
-    # keeps capturing depth images until obstacle detect
+    # keeps capturing depth images until way ahead is clear
     depthValue = None
     while depthValue is None or depthValue < MAX_THRESHOLD_DISTANCE_CM:
-        depthValue = captureImageAndCheckForObstacle(zed, leftImage, leftDepthMatrix, runtime_params)[0]
+        depthArray, timestampMillisecond = depth_grabber.getNewDepth()
+        depthValue = getDepthStraightAhead(depthArray, DEPTH_CENTER_X, DEPTH_CENTER_Y)
+        print("Time: {0} ms, Distance from camera straight ahead: {1} cm".format(timestampMillisecond -
+            PROGRAM_START_TIME_MS, depthValue))
 
 
 def moveForwardUntilSignaled(motor, stop_event):
     """
     Repeatedly sends move forward commands to the robot, which is necessary to keep the robot moving overtime. Should
-    be executed as a new process.
+    be executed as a new thread.
 
     :param motor: the Motor Controller for moving the robot
     :param stop_event: the Event object that tracks when robot receives the command to stop
-    :param output_file: the file to print output to
-    :param write_output_lock: lock used to protect writing output when using multiprocessing
-    :param child_connection: the end of pipe to receive depth sensor data from
     """
     speed = FORWARD_SPEED
     while not stop_event.is_set():
@@ -216,6 +480,9 @@ def initializationForTest(motor_com_port=None):
     init_params = sl.InitParameters()
     init_params.depth_mode = sl.DEPTH_MODE.PERFORMANCE
     init_params.coordinate_units = sl.UNIT.CENTIMETER
+    init_params.camera_resolution = sl.RESOLUTION.VGA  # obstacle detection only needs a few lines of depth values
+    init_params.camera_fps = 30
+    init_params.depth_stabilization = False  # temporal filtering only adds latency for obstacle detection
 
     # opens the camera
     error = zed.open(init_params)
@@ -223,33 +490,34 @@ def initializationForTest(motor_com_port=None):
         print("Failed to open camera. Error code:", error)
         exit(1)
 
+    # compiles obstacle detection ahead of time (for a strided band like the real one) so that the first captured
+    # frame is not delayed by it
+    if njit is not None:
+        findObstacleBoundsInBand(np.zeros((4, 2), dtype=np.float32)[::2], MAX_OBSTACLE_DEPTH_CM)
+
     return motor, zed
 
 
-def moveForwardAndStopTest(motor, zed):
+def moveForwardAndStopTest(motor, depth_grabber):
     """
     Test run in which the robot moves forward and stops when it gets close enough to an obstacle. Outputs robot's
     performance to standard output and to an output file.
     """
-    # one core used for capturing images, one core used for repeatedly sending move forward commands
-    if multiprocessing.cpu_count() < 2:
-        print("Testing error: need at least 2 CPU's")
-        return
-
     # initialization
-    stopEvent = multiprocessing.Event()
+    stopEvent = threading.Event()
 
-    # moves robot forward
-    moveRobotForwardProcess = multiprocessing.Process(target=moveForwardUntilSignaled, args=(motor, stopEvent))
+    # moves robot forward; sending commands mostly waits on the serial port, so a thread is enough to keep it from
+    # blocking image capture
+    moveRobotForwardThread = threading.Thread(target=moveForwardUntilSignaled, args=(motor, stopEvent), daemon=True)
     print("Robot moving forward")
-    moveRobotForwardProcess.start()
+    moveRobotForwardThread.start()
 
     # keeps moving forward until it sees close enough obstacle in front of it
-    captureImagesUntilCloseToObstacle(zed)
+    captureImagesUntilCloseToObstacle(depth_grabber)
 
     # stops robot
     stopEvent.set()
-    moveRobotForwardProcess.join()
+    moveRobotForwardThread.join()
     if motor is not None:
         motor.stop()
 
@@ -257,7 +525,7 @@ def moveForwardAndStopTest(motor, zed):
     collisionFlag = False
     counter = 0  # used to periodically remind that robot is stopping in the output
     while not collisionFlag:
-        depthValue = captureImageAndCheckForObstacle(zed, sl.Mat(), sl.Mat(), sl.RuntimeParameters())[0]
+        depthValue = captureImageAndCheckForObstacle(depth_grabber)[0]
         if depthValue <= 0 or counter == 0:
             if depthValue > 0:
                 print("Robot stopping")
@@ -267,23 +535,17 @@ def moveForwardAndStopTest(motor, zed):
         counter = (counter + 1) % 10
 
 
-def moveForwardAndStopTestNoMultiprocessing(motor, zed):
-    # initialization for using sensor data
-    leftImage = sl.Mat()
-    leftDepthMatrix = sl.Mat()
-    runtimeParameters = sl.RuntimeParameters()
-
+def moveForwardAndStopTestNoMultiprocessing(motor, depth_grabber):
     # keeps capturing depth images until obstacle detected
     depthValue = None
-    x = int(leftImage.get_width() / 2)
-    y = int(leftImage.get_height() / 2)
+    x, y = DEPTH_CENTER_X, DEPTH_CENTER_Y
     speed = FORWARD_SPEED
     lastTime = time.time()  # time when image was last captured
     while depthValue is None or depthValue > MIN_THRESHOLD_DISTANCE_CM:
         currTime = time.time()
         TIME_DIFF = 0.001  # time difference (in sec) for updating depthValue
         if currTime - lastTime > TIME_DIFF:
-            depthValue, x, y = captureImageAndCheckForObstacle(zed, leftImage, leftDepthMatrix, runtimeParameters)
+            depthValue, x, y = captureImageAndCheckForObstacle(depth_grabber)
             print("Sent move forward command with speed = {0}".format(speed))
             lastTime = currTime
         if motor is not None:
@@ -295,7 +557,7 @@ def moveForwardAndStopTestNoMultiprocessing(motor, zed):
             countConfirm = 0
             falseAlarm = False
             while countConfirm < CONFIRM_TIMES or falseAlarm:
-                depthValue, x, y = captureImageAndCheckForObstacle(zed, leftImage, leftDepthMatrix, runtimeParameters)
+                depthValue, x, y = captureImageAndCheckForObstacle(depth_grabber)
                 if depthValue > MIN_THRESHOLD_DISTANCE_CM:
                     falseAlarm = True
                 else:
@@ -309,7 +571,7 @@ def moveForwardAndStopTestNoMultiprocessing(motor, zed):
     collisionFlag = False
     counter = 0  # used to periodically remind that robot is stopping in the output
     while not collisionFlag:
-        depthValue = captureImageAndCheckForObstacle(zed, sl.Mat(), sl.Mat(), sl.RuntimeParameters())[0]
+        depthValue = captureImageAndCheckForObstacle(depth_grabber)[0]
         if depthValue <= 0 or counter == 0:
             if depthValue > 0:
                 print("Robot stopping")
@@ -328,11 +590,14 @@ if __name__ == "__main__":
     motorForTest, zedForTest = initializationForTest('COM5')
     PROGRAM_START_TIME_MS = MS_PER_SEC * int(time.time())
     print("Start time:", PROGRAM_START_TIME_MS)
+    depthGrabberForTest = LatestDepthGrabber(zedForTest)
+    depthGrabberForTest.start()
 
-    # moveForwardAndStopTest(motorForTest, zedForTest)  # on successful stop, press Ctrl+C to stop program
-    moveForwardAndStopTestNoMultiprocessing(motorForTest, zedForTest)
+    # moveForwardAndStopTest(motorForTest, depthGrabberForTest)  # on successful stop, press Ctrl+C to stop program
+    moveForwardAndStopTestNoMultiprocessing(motorForTest, depthGrabberForTest)
     
     # cleanup
     if motorForTest is not None:
         motorForTest.shutDown()
+    depthGrabberForTest.stop()
     zedForTest.close()
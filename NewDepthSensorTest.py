@@ -9,9 +9,15 @@ Date: February 14, 2024
 
 from MotorControlAPI import MotorController
 import pyzed.sl as sl
-import math
+import numpy as np
+import threading
 import time
 
+try:
+    from numba import njit  # optional; compiles the depth row scan to machine code
+except ImportError:
+    njit = None
+
 # how close robot should be allowed to approach obstacle (in cm)
 THRESHOLD_DISTANCE = 150
 
@@ -19,13 +25,33 @@ THRESHOLD_DISTANCE = 150
 MIN_OBSTACLE_DEPTH = 0
 MAX_OBSTACLE_DEPTH = 300
 
+# band of horizontal lines around center of depth image to scan for obstacles (in pixels)
+SCAN_BAND_HALF_HEIGHT = 60
+SCAN_ROW_STEP = 8
+
+# half the size of window around center of depth image used to check if way ahead is clear (in pixels)
+CENTER_WINDOW_HALF_SIZE = 8
+
+# runtime parameters shared by every capture; depth values with confidence below the threshold are discarded, and
+# measurements stay relative to the camera since obstacle detection never needs world-frame positions
+RUNTIME_PARAMETERS = sl.RuntimeParameters()
+RUNTIME_PARAMETERS.confidence_threshold = 50
+RUNTIME_PARAMETERS.measure3D_reference_frame = sl.REFERENCE_FRAME.CAMERA
+
 # speed settings for motor controls
 FORWARD_SPEED = 25
 TURNING_SPEED = 25
 
-initialTime = time.time_ns()
+# how often to send the same move command to robot (in ms between commands) to make it do the same thing overtime
+COMMAND_SEND_PERIOD_MS = 100
+MS_PER_SEC = 1000  # number of milliseconds per second
 
-ONE_SECOND_DELAY = 1000000000
+# dimensions and center of camera images (in pixels); set by initializationForTest()
+IMAGE_WIDTH = None
+IMAGE_HEIGHT = None
+IMAGE_CENTER_X = None
+IMAGE_CENTER_Y = None
+IMAGE_ROWS_TO_SCAN = None  # lines of camera images to scan for obstacles
 
 
 # ======================================================================================================================
@@ -33,96 +59,183 @@ ONE_SECOND_DELAY = 1000000000
 # ======================================================================================================================
 
 
-def clipData(data_to_fix, lower_bound, upper_bound):
+def makeClipper(lower_bound, upper_bound):
     """
-    Determines new value for given value so that it stays within given bounds. Values outside of bounds get reassigned
-    to the closest bound value. Function is used to clean up noise in depth sensor data.
+    Makes a function that determines new value for given value so that it stays within given bounds. Values outside of
+    bounds (or NaN) get reassigned to the closest bound value. Function is used to clean up noise in depth sensor data.
+    The bounds are bound in, so they don't need to be looked up as globals and passed in on every call.
 
-    :param data_to_fix: float value to recompute from
     :param lower_bound: the lowest value acceptable for value
     :param upper_bound: the highest value acceptable for value
 
-    :return: the updated data value as a float
+    :return: function taking the float value to recompute from and returning the updated data value as a float
+    """
+    def clip(data_to_fix):
+        if data_to_fix > upper_bound or data_to_fix != data_to_fix:  # NaN is the only value not equal to itself
+            return upper_bound
+        elif data_to_fix < lower_bound:
+            return lower_bound
+        return data_to_fix
+
+    return clip
+
+
+# cleans up a depth value (in cm) using the obstacle depth bounds
+clipDepth = makeClipper(MIN_OBSTACLE_DEPTH, MAX_OBSTACLE_DEPTH)
+
+
+def getRowsToScan(center_y):
     """
-    if data_to_fix > upper_bound or math.isnan(data_to_fix):
-        return upper_bound
-    elif data_to_fix < lower_bound:
-        return lower_bound
-    return data_to_fix
+    Determines which horizontal lines of the depth image to scan for obstacles: every SCAN_ROW_STEP-th line within
+    SCAN_BAND_HALF_HEIGHT lines of the center line. Scanning a band instead of a single line keeps obstacles that sit
+    slightly above or below the center line from being missed.
 
+    :param center_y: index of center line of depth measurement
 
-def getCoordinatesOfCloseObstacle(image, depth_matrix):
+    :return: the lines to scan as a slice of row indices
     """
-    Detects approximate point on center line of image for any obstacle that may be close.
+    return slice(max(center_y - SCAN_BAND_HALF_HEIGHT, 0), center_y + SCAN_BAND_HALF_HEIGHT + 1, SCAN_ROW_STEP)
 
-    :param image: image retrieved using ZED SDK
-    :param depth_matrix: depth measurement retrieved using ZED SDK (in cm)
 
-    :return: center of obstacle (x, y) as a 2-tuple, or None if no obstacle detected
+def isObstacleInColumn(band, column, upper_bound):
     """
-    # initialization
-    centerY = int(image.get_height() / 2)
-    depthList = []  # stores depth values of pixels on center horizontal line of image
+    Checks whether any depth value in a column of a band of depth values is close enough to be part of an obstacle.
+    NaN values never compare as less than the bound, so missing depth data counts as no obstacle.
+
+    :param band: 2D float32 array of depth values (in cm)
+    :param column: index of column to check
+    :param upper_bound: depth values at or above this are not considered part of an obstacle
+
+    :return: True if column has part of an obstacle, otherwise False
+    """
+    for currentY in range(band.shape[0]):
+        if band[currentY, column] < upper_bound:
+            return True
+    return False
+
+
+def getDepthStraightAhead(depth_array, center_x, center_y):
+    """
+    Gets depth value straight ahead of camera: the closest depth value in a small window around the center of the
+    image. Much cheaper than scanning for obstacles when only whether the way ahead is clear matters.
+
+    :param depth_array: depth measurement retrieved using ZED SDK as a NumPy array (in cm)
+    :param center_x: index of center column of depth measurement
+    :param center_y: index of center line of depth measurement
+
+    :return: the depth value (in cm) as a float
+    """
+    window = depth_array[center_y - CENTER_WINDOW_HALF_SIZE:center_y + CENTER_WINDOW_HALF_SIZE,
+                         center_x - CENTER_WINDOW_HALF_SIZE:center_x + CENTER_WINDOW_HALF_SIZE]
+    return clipDepth(float(np.fmin.reduce(window, axis=None)))
+
+
+def findObstacleBoundsInBand(band, upper_bound):
+    """
+    Finds where the first obstacle starts and ends on a band of horizontal lines of depth values. When compiled with
+    Numba, combining the lines and searching for the obstacle are done in a single pass that compares the depth values
+    in place against the bound and only goes as far in from each side as the obstacle. Depth values are neither clipped
+    nor have NaN replaced (NaN never compares as less than the bound, so it counts as no obstacle); only the single
+    depth value reported for the obstacle is clipped afterwards by clipDepth().
 
-    # extracts depth values on center horizontal line of image
-    for currentX in range(image.get_width()):
-        error, currentDepth = depth_matrix.get_value(currentX, centerY)
-        # cleans up data
-        currentDepth = clipData(currentDepth, MIN_OBSTACLE_DEPTH, MAX_OBSTACLE_DEPTH)
-        depthList.append(currentDepth)
+    :param band: 2D float32 array of depth values (in cm), e.g. a strided view of the depth image; not modified
+    :param upper_bound: depth values at or above this are not considered part of an obstacle
 
+    :return: leftmost and rightmost pixels of obstacle as a 2-tuple, or (-1, -1) if no obstacle detected
+    """
     # finds leftmost pixel of obstacle
     leftBoundX = 0
-    while leftBoundX < len(depthList) and depthList[leftBoundX] >= MAX_OBSTACLE_DEPTH:
+    while leftBoundX < band.shape[1] and not isObstacleInColumn(band, leftBoundX, upper_bound):
         leftBoundX += 1
 
     # checks if no obstacle detected
-    if leftBoundX >= len(depthList):
-        return None
+    if leftBoundX >= band.shape[1]:
+        return -1, -1
 
     # finds rightmost pixel of obstacle
-    rightBoundX = len(depthList) - 1
-    while rightBoundX >= 0 and depthList[rightBoundX] >= MAX_OBSTACLE_DEPTH:
+    rightBoundX = band.shape[1] - 1
+    while rightBoundX >= 0 and not isObstacleInColumn(band, rightBoundX, upper_bound):
         rightBoundX -= 1
 
+    return leftBoundX, rightBoundX
+
+
+if njit is not None:
+    isObstacleInColumn = njit(cache=True)(isObstacleInColumn)
+    findObstacleBoundsInBand = njit(cache=True)(findObstacleBoundsInBand)
+
+
+def getCoordinatesOfCloseObstacle(depth_array, width, center_y, rows_to_scan):
+    """
+    Detects approximate point on center line of image for any obstacle that may be close. Lines within a band around
+    the center line are scanned, using the closest depth value in each column.
+
+    :param depth_array: depth measurement retrieved using ZED SDK as a NumPy array (in cm)
+    :param width: width of depth measurement (in pixels)
+    :param center_y: index of center line of depth measurement
+    :param rows_to_scan: lines of depth measurement to scan, as returned by getRowsToScan()
+
+    :return: center of obstacle and closest depth value in its column (x, y, depth) as a 3-tuple, or None if no
+        obstacle detected
+    """
+    if njit is not None:
+        # finds obstacle in a single compiled pass over horizontal lines around center of image
+        band = depth_array[rows_to_scan, :width]  # view, so no depth values are copied
+        leftBoundX, rightBoundX = findObstacleBoundsInBand(band, MAX_OBSTACLE_DEPTH)
+        if leftBoundX < 0:
+            return None
+    else:
+        # keeps closest depth value in each column by reducing the horizontal lines around center of image straight from
+        # the depth image (fmin skips NaN, so the lines are neither copied nor cleaned up first)
+        row = np.fmin.reduce(depth_array[rows_to_scan, :width], axis=0)
+
+        # checks if no obstacle detected; no need to clean up data first since NaN (no depth data in whole column)
+        # never compares as less than the bound, so it counts as no obstacle
+        isObstacle = row < MAX_OBSTACLE_DEPTH
+        if not isObstacle.any():
+            return None
+
+        # finds leftmost and rightmost pixels of obstacle (argmax stops at first True)
+        leftBoundX = int(isObstacle.argmax())
+        rightBoundX = len(isObstacle) - 1 - int(isObstacle[::-1].argmax())
+
     # gets center pixel between the two boundary pixels
     centerOfObstacleX = int((leftBoundX + rightBoundX) / 2)
-    return centerOfObstacleX, centerY
+
+    # gets closest depth value in center column of obstacle, reusing the reduced row when there is one
+    if njit is not None:
+        depthValue = float(np.fmin.reduce(band[:, centerOfObstacleX]))
+    else:
+        depthValue = float(row[centerOfObstacleX])
+    depthValue = clipDepth(depthValue)
+    return centerOfObstacleX, center_y, depthValue
 
 
-def captureImagesUntilCloseToObstacle(zed, motors):
+def captureImagesUntilCloseToObstacle(zed):
     """
     Uses depth sensor to wait until a close obstacle is detected. Used to avoid colliding into obstacles.
 
     :param zed: the ZED camera whose depth sensor to use
     """
     # initialization for using sensor data
-    leftImage = sl.Mat()
     leftDepthMatrix = sl.Mat()
-    runtime_params = sl.RuntimeParameters()
 
     # keeps capturing depth images until obstacle detect
     depthValue = THRESHOLD_DISTANCE + 10
-    initialTime = 0
     while depthValue > THRESHOLD_DISTANCE:
-        if (time.time_ns() > initialTime + (ONE_SECOND_DELAY*0.1)):
-            motors.forward(20)
-            initialTime = time.time_ns()
         # grabs an image
-        error = zed.grab(runtime_params)
+        error = zed.grab(RUNTIME_PARAMETERS)
         if error == sl.ERROR_CODE.SUCCESS:
-            zed.retrieve_image(leftImage, sl.VIEW.LEFT)  # gets left image
             zed.retrieve_measure(leftDepthMatrix, sl.MEASURE.DEPTH)  # gets left depth image
+            depthArray = leftDepthMatrix.get_data()  # views depth image as NumPy array without copying it
 
             # gets depth value of obstacle, if any
-            obstacleCoordinates = getCoordinatesOfCloseObstacle(leftImage, leftDepthMatrix)
-            if obstacleCoordinates is None:
-                x = int(leftImage.get_width() / 2)
-                y = int(leftImage.get_height() / 2)
+            obstacle = getCoordinatesOfCloseObstacle(depthArray, IMAGE_WIDTH, IMAGE_CENTER_Y, IMAGE_ROWS_TO_SCAN)
+            if obstacle is None:
+                # every column in the band is at or beyond the max depth (or has no depth data)
+                x, y, depthValue = IMAGE_CENTER_X, IMAGE_CENTER_Y, MAX_OBSTACLE_DEPTH
             else:
-                x, y = obstacleCoordinates
-            err, depthValue = leftDepthMatrix.get_value(x, y)
-            depthValue = clipData(depthValue, MIN_OBSTACLE_DEPTH, MAX_OBSTACLE_DEPTH)
+                x, y, depthValue = obstacle
             print("Distance from camera at ({0}, {1}): {2} cm".format(x, y, depthValue))
         else:
             print("Failed to grab image. Error:", error)
@@ -136,33 +249,37 @@ def captureImagesUntilClear(zed):
     :param zed: the ZED camera whose depth sensor to use
     """
     # initialization for using sensor data
-    leftImage = sl.Mat()
     leftDepthMatrix = sl.Mat()
-    runtime_params = sl.RuntimeParameters()
 
-    # keeps capturing depth images until obstacle detect
+    # keeps capturing depth images until way ahead is clear
     depthValue = THRESHOLD_DISTANCE - 10
     while depthValue < THRESHOLD_DISTANCE:
         # grabs an image
-        error = zed.grab(runtime_params)
+        error = zed.grab(RUNTIME_PARAMETERS)
         if error == sl.ERROR_CODE.SUCCESS:
-            zed.retrieve_image(leftImage, sl.VIEW.LEFT)  # gets left image
             zed.retrieve_measure(leftDepthMatrix, sl.MEASURE.DEPTH)  # gets left depth image
 
-            # gets depth value of obstacle, if there is an obstacle
-            obstacleCoordinates = getCoordinatesOfCloseObstacle(leftImage, leftDepthMatrix)
-            if obstacleCoordinates is None:
-                x = int(leftImage.get_width() / 2)
-                y = int(leftImage.get_height() / 2)
-            else:
-                x, y = obstacleCoordinates
-            err, depthValue = leftDepthMatrix.get_value(x, y)
-            depthValue = clipData(depthValue, MIN_OBSTACLE_DEPTH, MAX_OBSTACLE_DEPTH)
-            print("Distance from camera at ({0}, {1}): {2} cm".format(x, y, depthValue))
+            # gets depth value straight ahead; no need to scan for where an obstacle is
+            depthValue = getDepthStraightAhead(leftDepthMatrix.get_data(), IMAGE_CENTER_X, IMAGE_CENTER_Y)
+            print("Distance from camera straight ahead: {0} cm".format(depthValue))
         else:
             print("Failed to grab image. Error:", error)
 
 
+def moveForwardUntilSignaled(motor, stop_event):
+    """
+    Repeatedly sends move forward commands to the robot, which is necessary to keep the robot moving overtime. Should
+    be executed as a new thread.
+
+    :param motor: the Motor Controller for moving the robot, or None if not connected to motor
+    :param stop_event: the Event object that tracks when robot receives the command to stop
+    """
+    while not stop_event.is_set():
+        if motor is not None:
+            motor.forward(FORWARD_SPEED)
+        stop_event.wait(COMMAND_SEND_PERIOD_MS / MS_PER_SEC)
+
+
 # ======================================================================================================================
 # Test Runs
 # ======================================================================================================================
@@ -176,12 +293,17 @@ def initializationForTest(motor_com_port=None):
     :param motor_com_port: com port to connect with motor, or None to not connect to motor
     :return: motor controller and ZED camera object as a 2-tuple (Motor, Camera); motor = None if enable_motor = False
     """
+    global IMAGE_WIDTH, IMAGE_HEIGHT, IMAGE_CENTER_X, IMAGE_CENTER_Y, IMAGE_ROWS_TO_SCAN
+
     # initialization
     zed = sl.Camera()
     motor = MotorController(motor_com_port) if motor_com_port else None
     init_params = sl.InitParameters()
     init_params.depth_mode = sl.DEPTH_MODE.PERFORMANCE
     init_params.coordinate_units = sl.UNIT.CENTIMETER
+    init_params.camera_resolution = sl.RESOLUTION.VGA  # obstacle detection only needs a few lines of depth values
+    init_params.camera_fps = 30
+    init_params.depth_stabilization = False  # temporal filtering only adds latency for obstacle detection
 
     # opens the camera
     error = zed.open(init_params)
@@ -189,6 +311,17 @@ def initializationForTest(motor_com_port=None):
         print("Failed to open camera. Error code:", error)
         exit(1)
 
+    # image dimensions stay the same while camera is open
+    resolution = zed.get_camera_information().camera_configuration.resolution
+    IMAGE_WIDTH, IMAGE_HEIGHT = resolution.width, resolution.height
+    IMAGE_CENTER_X, IMAGE_CENTER_Y = int(IMAGE_WIDTH / 2), int(IMAGE_HEIGHT / 2)
+    IMAGE_ROWS_TO_SCAN = getRowsToScan(IMAGE_CENTER_Y)
+
+    # compiles obstacle detection ahead of time (for a strided band like the real one) so that the first captured
+    # frame is not delayed by it
+    if njit is not None:
+        findObstacleBoundsInBand(np.zeros((4, 2), dtype=np.float32)[::2], MAX_OBSTACLE_DEPTH)
+
     return motor, zed
 
 
@@ -196,13 +329,16 @@ def moveForwardAndStopTest(motor, zed):
     """
     Test run in which the robot moves forward and stops when it gets close enough to an obstacle.
     """
-    # moves robot forward
-    if motor is not None:
-        motor.forward(FORWARD_SPEED)
+    # moves robot forward, resending the command periodically so that it keeps moving
+    stopEvent = threading.Event()
+    moveRobotForwardThread = threading.Thread(target=moveForwardUntilSignaled, args=(motor, stopEvent), daemon=True)
+    moveRobotForwardThread.start()
     print("Robot moving forward")
 
     # keeps moving forward until it sees close enough obstacle in front of it
-    captureImagesUntilCloseToObstacle(zed, motor)
+    captureImagesUntilCloseToObstacle(zed)
+    stopEvent.set()
+    moveRobotForwardThread.join()
 
     motor.backward(20)
     time.sleep(0.01)
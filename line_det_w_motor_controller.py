@@ -2,110 +2,223 @@ import numpy as np
 import math
 import cv2
 import time
+import threading
+import queue
+import signal
 from MotorControlAPI import MotorController 
 
+try:
+    from numba import njit #optional; compiles the hough line classification to machine code
+except ImportError:
+    njit = None
+
 
 ROBOT_SPEED = 20
 ONE_SECOND_DELAY = 1000000000
+MOTOR_COMMAND_PERIOD_NS = ONE_SECOND_DELAY // 10 #least time between commands sent to the motor
+DOWNSCALE = 2 #factor frames are shrunk by before looking for lines (lines are scaled back up to full size)
+#fewest edge pixels worth looking for lines in (edges are thin, so there are DOWNSCALE times fewer in a smaller frame)
+MIN_EDGE_PIXELS = 200 // DOWNSCALE
+ROI_TOP = 0.6 #fraction of the frame height where the region of interest starts; nothing above it is processed
+MIN_WHITE_LIGHTNESS = 190 #lowest HLS lightness of pixels that count as white (part of a line)
+#hough transform parameters for finding lines (lengths in pixels of the full size frame)
+HOUGH_RHO = 1
+HOUGH_THETA = np.pi/180
+HOUGH_THRESHOLD = 10
+HOUGH_MIN_LINE_LENGTH = 20
+HOUGH_MAX_LINE_GAP = 5
+#finds edges and lines on the GPU when OpenCV was built with CUDA and there's a GPU to use
+USE_CUDA = hasattr(cv2, "cuda") and cv2.cuda.getCudaEnabledDeviceCount() > 0
+LOG_PERIOD_FRAMES = 100 #number of processed frames between logs of the frames dropped
+SHOW_DEBUG = False #shows the frames with the lane drawn on them (slows down processing, so only for debugging)
+DEBUG_DISPLAY_PERIOD_FRAMES = 3 #number of processed frames between frames shown (about 10 Hz at 30 fps)
 #myVar = MotorController('COMx')
 motorObj = MotorController('COM4')
+cmd_q = queue.Queue(maxsize=2) #directions waiting to be sent to the motor by the motor thread
+
+#directions to move in, used as indices into MOTOR_COMMANDS
+FORWARD, LEFT, RIGHT, BACKWARD, STOP = 0, 1, 2, 3, 4
+#message printed and function called to send each direction to the motor
+MOTOR_COMMANDS = (
+    ("Going Forward", lambda motor: motor.forward(ROBOT_SPEED)),
+    ("Going Left", lambda motor: motor.turnLeft(ROBOT_SPEED*2)),
+    ("Going Right", lambda motor: motor.turnRight(ROBOT_SPEED*2)),
+    ("Going Backwards", lambda motor: motor.backward(ROBOT_SPEED)),
+    ("Stopping", lambda motor: motor.stop()),
+)
+
 
+buffers = {} #images reused for every frame by name, so nothing is allocated while processing frames
+
+def get_buffer(name, shape):
+    #gets the image with the given name, only allocating a new one when the frame size changes
+    buffer = buffers.get(name)
+    if buffer is None or buffer.shape != shape:
+        buffer = np.empty(shape, dtype=np.uint8)
+        buffers[name] = buffer
+    return buffer
 
 def color_filter(image):
-    #convert from RGB to HLS (Hue, Lightness, Saturation)
-    hls = cv2.cvtColor(image, cv2.COLOR_RGB2HLS)
-    lower = np.array([0,190,0])
-    upper = np.array([255,255,255])
+    #convert from BGR (the order frames come from the camera in) to HLS (Hue, Lightness, Saturation)
+    hls = cv2.cvtColor(image, cv2.COLOR_BGR2HLS, dst=get_buffer("hls", image.shape))
 
- 
-    whitemask = cv2.inRange(hls, lower, upper)
-    
-    masked = cv2.bitwise_and(image, image, mask = whitemask)    
-    
+    #only lightness matters for white lines, so the L channel is thresholded directly (same as inRange with
+    #[0,MIN_WHITE_LIGHTNESS,0] to [255,255,255]), giving a single channel mask
+    lightness = cv2.extractChannel(hls, 1, dst=get_buffer("whitemask", image.shape[:2]))
+    _, whitemask = cv2.threshold(lightness, MIN_WHITE_LIGHTNESS - 1, 255, cv2.THRESH_BINARY, dst=lightness)
 
+    return whitemask
 
-    return masked
+if USE_CUDA:
+    gpu_gray = cv2.cuda_GpuMat() #reused for every frame so GPU memory is only allocated once
+    cuda_canny = cv2.cuda.createCannyEdgeDetector(50, 120)
+    #the GPU detector has no vote threshold
+    cuda_hough = cv2.cuda.createHoughSegmentDetector(HOUGH_RHO, HOUGH_THETA, HOUGH_MIN_LINE_LENGTH // DOWNSCALE,
+                                                     HOUGH_MAX_LINE_GAP // DOWNSCALE)
+
+def detect_edges(gray):
+    #using canny to get edges; returns them on the GPU (as a GpuMat) when using CUDA
+    if USE_CUDA:
+        gpu_gray.upload(gray)
+        return cuda_canny.detect(gpu_gray)
+    return cv2.Canny(gray, 50, 120, edges=get_buffer("edges", gray.shape))
+
+roi_cache = {} #region of interest masks by image size, since the region only depends on the size
 
 def roi(img):
     #function to idenify region of interest, using a triangle to focus on where the lines are
-    if img is not None:
-        x = int(img.shape[1])
-        y = int(img.shape[0])
-        shape = np.array([[int(0), int(y)], [int(x), int(y)], [int(0.55*x), int(0.6*y)], [int(0.45*x), int(0.6*y)]])
+    #`img` is the strip of the frame below ROI_TOP, so the top of the region is the top of the strip
+    #returns a single channel mask that is 255 inside the region and 0 outside of it
+    if img.shape[:2] in roi_cache:
+        return roi_cache[img.shape[:2]]
 
-        mask = np.zeros_like(img)
+    x = int(img.shape[1])
+    y = int(img.shape[0])
+    shape = np.array([[int(0), int(y)], [int(x), int(y)], [int(0.55*x), int(0)], [int(0.45*x), int(0)]])
 
-        #Uses 3 channels or 1 channel for color depending on input image
-        if len(img.shape) > 2:
-            channel_count = img.shape[2]
-            ignore_mask_color = (255,) * channel_count
-        else:
-            ignore_mask_color = 255
+    mask = np.zeros(img.shape[:2], dtype=np.uint8)
 
-        #creates a polygon with the mask color (for area between lines)
-        cv2.fillPoly(mask, np.int32([shape]), ignore_mask_color)
+    #creates a polygon with the mask color (for area between lines)
+    cv2.fillPoly(mask, np.int32([shape]), 255)
 
-        #returns the image only where the mask pixels are not zero
-        masked_image = cv2.bitwise_and(img, mask)
-        return masked_image
-    else: 
-        print("None")
+    roi_cache[img.shape[:2]] = mask
+    return mask
 
 def grayscale(img):
     #canny needs a gray image, so we convert
-    return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=get_buffer("gray", img.shape[:2]))
+
+
+def push_to_ring(values, state, new_values):
+    #overwrites the oldest value once the buffer is full, keeping the running sum up to date
+    for value in new_values:
+        index = int(state[0])
+        if state[1] < values.shape[0]:
+            state[1] += 1
+        else:
+            state[2] -= values[index]
+        values[index] = value
+        state[2] += value
+        state[0] = (index + 1) % values.shape[0]
+
+RIGHT_SLOPE, RIGHT_INTERCEPT, LEFT_SLOPE, LEFT_INTERCEPT = 0, 1, 2, 3
+
+def classify_lines(lines, classified):
+    #this is used to filter out the outlying lines that can affect the average
+    #We then use the slope we determined to find the y-intercept of the filtered lines by solving for b in y=mx+b
+    #the slopes and y-intercepts go in the rows of classified; returns the number of right and left lines found
+    right_count, left_count = 0, 0
+    for i in range(lines.shape[0]):
+        x1, y1, x2, y2 = lines[i, 0], lines[i, 1], lines[i, 2], lines[i, 3]
+        if x1 == x2:
+            continue #vertical line has no slope
+        slope = (y1-y2)/(x1-x2)
+        if slope > 0.3:
+            if x1 > 500:
+                classified[RIGHT_SLOPE, right_count] = slope
+                classified[RIGHT_INTERCEPT, right_count] = y2 - (slope*x2)
+                right_count += 1
+        elif slope < -0.3:
+            if x1 < 600:
+                classified[LEFT_SLOPE, left_count] = slope
+                classified[LEFT_INTERCEPT, left_count] = y2 - (slope*x2)
+                left_count += 1
+    return right_count, left_count
+
+if njit is not None:
+    push_to_ring = njit(cache=True)(push_to_ring)
+    classify_lines = njit(cache=True)(classify_lines)
 
-def canny(img):
-    #using canny to get edges
-    return cv2.Canny(grayscale(img), 50, 120)
 
+class RunningMeanRing:
+    #fixed size buffer of the latest values pushed to it, keeping a running sum so that their mean never has to be
+    #recomputed and memory use never grows
 
-rightSlope, leftSlope, rightIntercept, leftIntercept = [],[],[],[]
-def draw_lines(img, lines, thickness=5):
-    global rightSlope, leftSlope, rightIntercept, leftIntercept
+    def __init__(self, size=30):
+        self.values = np.zeros(size)
+        self.state = np.zeros(3) #index to write to next, number of values, running sum of values
 
+    def push(self, x):
+        #x can be a single value or an array of values
+        push_to_ring(self.values, self.state, np.atleast_1d(np.asarray(x, dtype=np.float64)))
+
+    def mean(self):
+        #nan while the buffer is still empty
+        return self.state[2] / self.state[1] if self.state[1] else math.nan
+
+
+#slopes and y-intercepts of the lines from the last 30 frames
+rightSlope, rightIntercept = RunningMeanRing(), RunningMeanRing()
+leftSlope, leftIntercept = RunningMeanRing(), RunningMeanRing()
+def draw_lines(img, lines, height, thickness=5):
+    #`height` is the full size frame's; the lane is only drawn when there's an image (`img`) to draw it on
     rightColor=[0,255,0]
     leftColor=[255,0,0]
     
-    #this is used to filter out the outlying lines that can affect the average
-    #We then use the slope we determined to find the y-intercept of the filtered lines by solving for b in y=mx+b
     if lines is not None: 
-        for line in lines:
-            for x1,y1,x2,y2 in line:
-                slope = (y1-y2)/(x1-x2)
-                if slope > 0.3:
-                    if x1 > 500 :
-                        yintercept = y2 - (slope*x2)                    
-                        rightSlope.append(slope)
-                        rightIntercept.append(yintercept)
-                    else: None                
-                elif slope < -0.3:
-                    if x1 < 600:
-                        yintercept = y2 - (slope*x2)                    
-                        leftSlope.append(slope)
-                        leftIntercept.append(yintercept)    
-    else:
-        hello = 0
+        lines = lines.reshape(-1, 4)
+        if njit is not None:
+            classified = np.empty((4, len(lines)))
+            right_count, left_count = classify_lines(lines, classified)
+            rightSlope.push(classified[RIGHT_SLOPE, :right_count])
+            rightIntercept.push(classified[RIGHT_INTERCEPT, :right_count])
+            leftSlope.push(classified[LEFT_SLOPE, :left_count])
+            leftIntercept.push(classified[LEFT_INTERCEPT, :left_count])
+        else:
+            #classifies all the lines at once (same as classify_lines); vertical lines get a nan slope, which fails
+            #both slope checks
+            x1, y1, x2, y2 = lines.T.astype(np.float64)
+            dx = x1 - x2
+            slope = (y1 - y2) / np.where(dx == 0, np.nan, dx)
+            yintercept = y2 - (slope*x2)
+            is_right = (slope > 0.3) & (x1 > 500)
+            is_left = (slope < -0.3) & (x1 < 600)
+            rightSlope.push(slope[is_right])
+            rightIntercept.push(yintercept[is_right])
+            leftSlope.push(slope[is_left])
+            leftIntercept.push(yintercept[is_left])
                     
                     
-    #We use slicing operators and np.mean() to find the averages of the 30 previous frames
+    #We use the running means of the ring buffers to find the averages of the 30 previous frames
     #This makes the lines more stable, and less likely to glitch
-    leftavgSlope = np.mean(leftSlope[-30:])
-    leftavgIntercept = np.mean(leftIntercept[-30:])
+    leftavgSlope = leftSlope.mean()
+    leftavgIntercept = leftIntercept.mean()
     
-    rightavgSlope = np.mean(rightSlope[-30:])
-    rightavgIntercept = np.mean(rightIntercept[-30:])
+    rightavgSlope = rightSlope.mean()
+    rightavgIntercept = rightIntercept.mean()
     
     left_line_x1 = None 
     right_line_x1 = None
     #plotting the lines
     try:
-        left_line_x1 = int((0.65*img.shape[0] - leftavgIntercept)/leftavgSlope)
-        left_line_x2 = int((img.shape[0] - leftavgIntercept)/leftavgSlope)
+        left_line_x1 = int((0.65*height - leftavgIntercept)/leftavgSlope)
+        left_line_x2 = int((height - leftavgIntercept)/leftavgSlope)
     
-        right_line_x1 = int((0.65*img.shape[0] - rightavgIntercept)/rightavgSlope)
-        right_line_x2 = int((img.shape[0] - rightavgIntercept)/rightavgSlope)
+        right_line_x1 = int((0.65*height - rightavgIntercept)/rightavgSlope)
+        right_line_x2 = int((height - rightavgIntercept)/rightavgSlope)
 
+        if img is None:
+            return [left_line_x1, right_line_x1]
         pts = np.array([[left_line_x1, int(0.65*img.shape[0])],[left_line_x2, int(img.shape[0])],[right_line_x2, int(img.shape[0])],[right_line_x1, int(0.65*img.shape[0])]], np.int32)
         pts = pts.reshape((-1,1,2))
         cv2.fillPoly(img,[pts],(0,0,255))      
@@ -122,86 +235,188 @@ def draw_lines(img, lines, thickness=5):
     
     
                 
-def hough_lines(img, rho, theta, threshold, min_line_len, max_line_gap):
+def hough_lines(img, out_shape=None, top=0, show=True):
     """
-    `img` should be the output of a Canny transform.
+    `img` should be the output of a Canny transform of a frame downscaled by DOWNSCALE.
+    `out_shape` is the height and width of the returned image (the full size frame's by default).
+    `top` is the row of the downscaled frame that `img` starts at, when `img` is only a strip of it.
+    `show` is whether the lane is drawn; None is returned instead of an image when it isn't.
     """
-    #using hough to get the lines from the canny image
-    lines = cv2.HoughLinesP(img, rho, theta, threshold, np.array([]), minLineLength=min_line_len, maxLineGap=max_line_gap)
-    line_img = np.zeros((img.shape[0], img.shape[1], 3), dtype=np.uint8)
-    coors = draw_lines(line_img, lines)
+    #using hough to get the lines from the canny image, unless there are too few edges for any lines to be found; then
+    #the averages in draw_lines stay the same, so the robot keeps going in the last direction
+    edge_count = cv2.cuda.countNonZero(img) if USE_CUDA else cv2.countNonZero(img)
+    if edge_count < MIN_EDGE_PIXELS:
+        lines = None
+    elif USE_CUDA:
+        #only the line endpoints are copied back from the GPU
+        gpu_lines = cuda_hough.detect(img)
+        lines = None if gpu_lines.empty() else gpu_lines.download().reshape(-1, 1, 4)
+    else:
+        #thresholds are in pixels of the smaller frame
+        lines = cv2.HoughLinesP(img, HOUGH_RHO, HOUGH_THETA, HOUGH_THRESHOLD // DOWNSCALE, np.array([]),
+                                minLineLength=HOUGH_MIN_LINE_LENGTH // DOWNSCALE,
+                                maxLineGap=HOUGH_MAX_LINE_GAP // DOWNSCALE)
+    if lines is not None:
+        #stays int32, the type classify_lines is compiled for ahead of time
+        lines = (lines + np.array((0, top, 0, top), dtype=np.int32)) * DOWNSCALE
+    if out_shape is None:
+        out_shape = ((img.shape[0] + top) * DOWNSCALE, img.shape[1] * DOWNSCALE)
+    #steering only needs the x coordinates of the lines, so the lane is only drawn for frames that will be shown, on
+    #the image from the last frame of the same size, cleared instead of allocated
+    line_img = None
+    if show:
+        line_img = get_buffer("line_img", (out_shape[0], out_shape[1], 3))
+        line_img.fill(0)
+    coors = draw_lines(line_img, lines, out_shape[0])
     #line_img2 = cv2.circle(line_img, (coors[0], 400), radius=10, color=(255, 255, 255), thickness=-6)
     #line_img2 = cv2.circle(line_img2, (coors[1], 400), radius=10, color=(255, 255, 255), thickness=-6)
-    direction = "up"
+    direction = FORWARD
     if coors[0] is not None and coors[1] is not None: 
         left_diff = int(coors[0])
         right_diff = 635-int(coors[1])
         padding = 20
-        if (right_diff -padding < left_diff) and (left_diff < right_diff + padding):
-            print("stay straight")
-            direction = "up"
-        elif (left_diff < right_diff - padding) :
-            print("move left")
-            direction = "left"
-        elif (left_diff > right_diff + padding): 
-            print("move right")
-            direction = "right"
-    initialTime = time.time_ns()
-    initialTime = sendMotorCommand(motorObj, direction, initialTime)
+        #stays straight while the differences are within padding of each other, otherwise moves left when left_diff
+        #is smaller and right when it's larger
+        difference = left_diff - right_diff
+        direction = (abs(difference) > padding) * (LEFT + (difference > 0))
+        print(("stay straight", "move left", "move right")[direction])
+    #the motor thread sends it, so the serial port never stalls image processing
+    put_latest(cmd_q, direction)
     
     return line_img
 
 
-def linedetect(img):
-    return hough_lines(img, 1, np.pi/180, 10, 20, 100).first
-
-
-def processImage(image):
+def processImage(image, show=False):
     #function to combine all previous functions
-    interest = roi(image)
-    
-    filterimg = color_filter(interest)
-    canny = cv2.Canny(grayscale(filterimg), 50, 120)
-    myline = hough_lines(canny, 1, np.pi/180, 10, 20, 5)
-    
-    weighted_img = cv2.addWeighted(myline, 1, image, 0.8, 0)
-    cv2.imshow("img", weighted_img)
-
+    #the lane is only blended onto the frame when it's going to be shown
+    #lines are found on a smaller copy of the frame, since they don't need full resolution to be found
+    small_shape = (image.shape[0] // DOWNSCALE, image.shape[1] // DOWNSCALE, image.shape[2])
+    small = cv2.resize(image, (small_shape[1], small_shape[0]), dst=get_buffer("small", small_shape),
+                       interpolation=cv2.INTER_AREA)
+    #everything above the region of interest would be masked out anyway, so only the strip below it is processed
+    top = int(ROI_TOP*small.shape[0])
+    strip = small[top:]
 
-    ''' motorObj = MotorController('COM4')
-    initialTime = time.time_ns()
-    initialTime = sendMotorCommand(motorObj, command, initialTime)'''
+    #keeps only the white pixels in the region of interest, masking a single channel gray image instead of the
+    #color image (in place, since the mask is all 0s and 255s, and-ing with it masks)
+    whitemask = color_filter(strip)
+    cv2.bitwise_and(whitemask, roi(strip), dst=whitemask)
+    gray = grayscale(strip)
+    masked_gray = cv2.bitwise_and(gray, whitemask, dst=gray)
+    canny = detect_edges(masked_gray)
+    #lines are drawn on a full size image, when it's going to be shown
+    myline = hough_lines(canny, image.shape[:2], top, show)
+    
+    #the lane and lines are only drawn below 0.65 of the frame height (lines are 10 pixels thick), so only that part of
+    #the frame is blended with them, in place instead of into a new image
+    if show:
+        overlay = slice(max(int(0.65*image.shape[0]) - 5, 0), image.shape[0])
+        cv2.addWeighted(myline[overlay], 1, image[overlay], 0.8, 0, dst=image[overlay])
+    weighted_img = image
     
     return weighted_img
 
 def sendMotorCommand(motorObj, command, lastCommandTime):
-    if (time.time_ns() > lastCommandTime + (ONE_SECOND_DELAY*0.1)):
-            lastCommandTime = time.time_ns()
-            if (command == "up"):
-                print("Going Forward")
-                motorObj.forward(ROBOT_SPEED)
-            elif (command == "down"):
-                print("Going Backwards")
-                motorObj.backward(ROBOT_SPEED)
-            elif (command == "left"):
-                print("Going Left")
-                motorObj.turnLeft(ROBOT_SPEED*2)
-            elif (command == "right"):
-                print("Going Right")
-                motorObj.turnRight(ROBOT_SPEED*2)
-            elif (command == "stop"):
-                print("Stopping")
-                motorObj.stop()
+    #monotonic clock, so changes to the system time never hold back or speed up commands
+    now = time.monotonic_ns()
+    if (now - lastCommandTime > MOTOR_COMMAND_PERIOD_NS):
+            lastCommandTime = now
+            message, send = MOTOR_COMMANDS[command]
+            print(message)
+            send(motorObj)
     return lastCommandTime
 
 
+def put_latest(q, item):
+    #puts an item in a bounded queue without blocking, dropping the oldest item if the queue is full
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            pass
+        q.put_nowait(item)
+
+
+def motor_writer(motorObj, cmd_q):
+    #sends directions from the processing loop to the motor (at most one command every 100 ms) until it gets None
+    lastCommandTime = time.monotonic_ns() - MOTOR_COMMAND_PERIOD_NS - 1 #so the first command is sent right away
+    while True:
+        command = cmd_q.get()
+        if command is None:
+            break
+        lastCommandTime = sendMotorCommand(motorObj, command, lastCommandTime)
+
+
+frames_dropped = 0 #frames grabbed but never processed because the main loop was still busy with an older one
+
+def reader(cap, frame_q, frame_requested, stop_event):
+    #keeps grabbing frames so the camera's buffer never holds stale ones, but only decodes (retrieves) a frame when
+    #the main loop asks for one, so every processed frame is at most one frame period old
+    global frames_dropped
+    grabs_since_retrieve = 0
+    while not stop_event.is_set():
+        if not cap.grab():
+            break
+        grabs_since_retrieve += 1
+        if frame_requested.is_set():
+            frame_requested.clear()
+            frames_dropped += grabs_since_retrieve - 1
+            grabs_since_retrieve = 0
+            _, frame = cap.retrieve()
+            #drops any frame the main loop never picked up so only the latest one is kept
+            put_latest(frame_q, frame)
+    #lets the main loop know there are no more frames
+    put_latest(frame_q, None)
+
+
 cap = cv2.VideoCapture(0) #use cv2.VideoCapture(0) to access camera
-while(cap.isOpened()):
-     _, frame = cap.read()
-     final = processImage(frame)
-     #cv2.imshow("final", final)
-     if cv2.waitKey(1) & 0xFF == ord('q'):
+cap.set(cv2.CAP_PROP_BUFFERSIZE, 1) #only keep the latest frame in the camera's buffer (if the backend supports it)
+frame_q = queue.Queue(maxsize=1)
+frame_requested = threading.Event()
+stop_reader = threading.Event()
+#compiles the line classification ahead of time so that the first frames are not delayed by it
+if njit is not None:
+    classify_lines(np.zeros((1, 4), dtype=np.int32), np.empty((4, 1)))
+    RunningMeanRing().push(np.zeros(1))
+
+reader_thread = threading.Thread(target=reader, args=(cap, frame_q, frame_requested, stop_reader), daemon=True)
+reader_thread.start()
+motor_thread = threading.Thread(target=motor_writer, args=(motorObj, cmd_q), daemon=True)
+motor_thread.start()
+
+#frames are processed only on this thread; when processing takes longer than a frame period, the frames that pass
+#while processing are grabbed but never retrieved, so the robot still reacts to what's in front of it now
+frames_processed = 0
+#stops on Ctrl+C, so quitting doesn't depend on polling the display for a key press; a second Ctrl+C raises
+#KeyboardInterrupt as usual, in case the camera or motor hangs and the loop never gets to check for the first one
+stop_requested = threading.Event()
+
+def request_stop(signum, stack):
+    stop_requested.set()
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+signal.signal(signal.SIGINT, request_stop)
+while(cap.isOpened() and not stop_requested.is_set()):
+     frame_requested.set()
+     frame = frame_q.get()
+     if frame is None:
         break
+     show = SHOW_DEBUG and frames_processed % DEBUG_DISPLAY_PERIOD_FRAMES == 0
+     final = processImage(frame, show)
+     frames_processed += 1
+     if frames_processed % LOG_PERIOD_FRAMES == 0:
+        print("Frames dropped:", frames_dropped)
+
+     if show:
+        cv2.imshow("img", final)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+           break
 
+stop_reader.set()
+reader_thread.join()
+cmd_q.put(None)
+motor_thread.join()
 cap.release()
 cv2.destroyAllWindows()